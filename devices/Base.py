@@ -1,43 +1,103 @@
 """
     Basic class for thermal data acquisition devices.
 """
-from abc import ABC, abstractmethod
 from typing import List, Dict, Any
+from collections import deque
 from tqdm import tqdm
+import numpy as np
+import asyncio
+import time
 
 
-class Device(ABC):
+class Device:
+    # True if __init__ may ask for input (e.g. in precheck); such devices are initialized on the main thread
+    interactive_init = False
+
     def __init__(self, name, sampling_time):
         self.name = name
         self.sampling_time = sampling_time
         self.header = []
         self.write_mode = False
         self.write_keys = []
+        self._header_set = None
+        self._write_keys_set = None
+        self._next_sample_ts = 0.0
+        self._out_size = 0
+        self._out_pool = None
         assert isinstance(sampling_time, (int, float)), "Sampling time must be a number"
         assert sampling_time > 0, "Sampling time must be greater than 0"
         assert isinstance(name, str), "Device name must be a string"
                  
-    @abstractmethod
     def precheck(self):
         """
-        Abstract method to check the connection of the sensors.
+        Check the connection of the sensors; implemented by each device.
         """
-        pass
+        raise NotImplementedError
     
-    @abstractmethod
     def read_data(self):
         """
-        Abstract method to read data from the sensors.
+        Read data from the sensors; implemented by each device.
+        Returns immediately; pacing is done by wait_for_next_sample.
         
         :return: List of sensor readings.
         """
-        pass
+        raise NotImplementedError
+
+    async def read_data_async(self):
+        """
+        Awaitable read_data, so several devices can be read from one event loop.
+        By default the blocking read_data runs in the loop's thread pool.
+        """
+        return await asyncio.to_thread(self.read_data)
+
+    def wait_for_next_sample(self) -> None:
+        """
+        Sleep until the next sampling deadline; read_data itself does not wait.
+        If the reader fell behind, the schedule restarts from now.
+        """
+        now = time.monotonic()
+        if now < self._next_sample_ts:
+            time.sleep(self._next_sample_ts - now)
+            self._next_sample_ts += self.sampling_time
+        else:
+            self._next_sample_ts = now + self.sampling_time
+
+    def init_out_pool(self, size: int, depth: int = 4) -> None:
+        """
+        Preallocate the float64 buffers read_data hands out, size values each.
+        """
+        self._out_size = size
+        self._out_pool = deque((np.empty(size, dtype=np.float64) for _ in range(depth)), maxlen=depth)
+
+    def _get_out_buffer(self) -> np.ndarray:
+        if self._out_pool:
+            return self._out_pool.popleft()
+        return np.empty(self._out_size, dtype=np.float64)
+
+    def recycle(self, buf) -> None:
+        """
+        Give a buffer returned by read_data back to the pool, once its values have been copied.
+        """
+        if self._out_pool is not None and isinstance(buf, np.ndarray) and buf.shape == (self._out_size,):
+            self._out_pool.append(buf)
+
+    def freeze_keys(self) -> None:
+        """
+        Cache the header and write keys as frozensets for the subset checks.
+        Subclasses call this once the keys are final, and again if they change.
+        """
+        self._header_set = frozenset(self.header)
+        self._write_keys_set = frozenset(self.write_keys)
 
     def issubset_header(self, keys: List[str]) -> bool:
-        return set(keys).issubset(set(self.header))
+        if self._header_set is None:
+            self.freeze_keys()
+        return self._header_set.issuperset(keys)
     
     def issubset_write_keys(self, keys: List[str]) -> bool:
-        return set(keys).issubset(set(self.write_keys))
+        if self._write_keys_set is None:
+            self.freeze_keys()
+        return self._write_keys_set.issuperset(keys)
     
     def get_info(self) -> Dict[str, Any]:
         return {
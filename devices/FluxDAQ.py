@@ -1,9 +1,17 @@
 from devices.Base import *
+import numpy as np
 import serial
 import time
 import json
 
 
+def _to_float(token: bytes) -> float:
+    try:
+        return float(token)
+    except ValueError:
+        return float('nan')
+
+
 class FluxDAQ(Device):
     def __init__(self, port: str, DAQ_type: str, sensors: dict, baudrate: int = 9600,
                  sampling_time: int = 2, precheck_steps: int = 5, name: str = None):
@@ -33,6 +41,7 @@ class FluxDAQ(Device):
         self.baudrate = baudrate
 
         self.active_ports = [False] * 2 * report_num_sensors
+        self.num_fields = 2 * report_num_sensors
         self.s_list = [float('inf')] * report_num_sensors
         self.header = []
 
@@ -48,6 +57,11 @@ class FluxDAQ(Device):
                     self.active_ports[2 * (id - 1)] = True 
                 self.header.append(f'T{id}')
                 self.active_ports[2 * (id - 1) + 1] = True
+        # mask of the active fields in a reported line
+        self._active_mask = np.array(self.active_ports, dtype=bool)
+        self._n_active = int(self._active_mask.sum())
+        self.freeze_keys()
+        self.init_out_pool(self._n_active)
 
         # initialize the serial port
         if self.DAQ_type == 'FluxDAQ+':
@@ -86,10 +100,10 @@ class FluxDAQ(Device):
         for step in tqdm(range(precheck_steps)):
             if self.ser.inWaiting() > 0:
                 try:
-                    output_str = self.ser.readline().decode()
-                    # print(output_str)
-                    if len(output_str.split(',')) == self.report_num_sensors*2:
-                        output_data = [float(val) for i, val in enumerate(output_str.split(',')) if self.active_ports[i]]
+                    raw = self.ser.readline()
+                    # print(raw)
+                    if raw.count(b',') == self.num_fields - 1:
+                        output_data = np.fromstring(raw, dtype=np.float64, sep=',')[self._active_mask].tolist()
                         received_data += 1
                         data_lst.append(output_data)
                 except:
@@ -103,33 +117,32 @@ class FluxDAQ(Device):
             header_str = "   |   ".join(self.header)
             print("|   " + header_str + "   |")
             print("|   " + "-" * len(header_str) + "   |") 
+            row_fmt = "| " + " | ".join(["{:6.2f}"] * len(self.header)) + " |"
             for row in data_lst:
-                formatted_row = " | ".join([f"{float(val):6.2f}" for i, val in enumerate(row)])
-                print("| " + formatted_row + " |")
+                print(row_fmt.format(*row))
             
     def read_data(self):
         # TODO: check if collected data is correct/clean
-        output_str = None
+        raw = None
         if self.ser.inWaiting() > 0:
             outputs = self.ser.readlines()
+            # keep the latest complete line
             while len(outputs) > 0:
-                line = outputs.pop().decode().strip()
-                if len(line.split(',')) == self.report_num_sensors*2:
-                    output_str = line
+                line = outputs.pop()
+                if line.count(b',') == self.num_fields - 1:
+                    raw = line
                     break
-        if output_str is None:
-            time.sleep(self.sampling_time)
+        if raw is None:
             return None
-        output_data = []
-        for i, val in enumerate(output_str.split(',')):
-            if not self.active_ports[i]:
-                continue
-            try:
-                output_data.append(float(val))
-            except ValueError:
-                output_data.append(float('nan'))
-        time.sleep(self.sampling_time)
-        return output_data
+        try:
+            arr = np.fromstring(raw, dtype=np.float64, sep=',')
+        except ValueError:
+            arr = None
+        if arr is None or arr.size != self.num_fields:
+            # a token could not be parsed, fall back to per-token parsing with nan
+            arr = np.array([_to_float(token) for token in raw.split(b',')])
+        # the buffer comes from the pool, see Device.recycle
+        return np.compress(self._active_mask, arr, out=self._get_out_buffer())
 
 if __name__ == "__main__":
     config = 'config_FLUX_test.json'
@@ -141,5 +154,6 @@ if __name__ == "__main__":
                       device_config['sampling_time'], device_config['precheck_steps'])
     
     while True:
+        fluxdaq.wait_for_next_sample()
         data = fluxdaq.read_data()
         print(data)
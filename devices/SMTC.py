@@ -5,7 +5,9 @@
         https://github.com/SequentMicrosystems/smtc-rpi/tree/main
 """
 from devices.Base import *
-import time
+import numpy as np
+import asyncio
+import shlex
 import subprocess
 
 # Sensor types:
@@ -22,7 +24,18 @@ _sensor_types = {
 }
 
 
+def _batch_script(cmds: list) -> str:
+    """
+    smtc has no batch mode; join its command lines into one shell script
+    so a single subprocess runs them all, in order.
+    """
+    return '\n'.join(shlex.join(args) for args in cmds)
+
+
 class TCHAT(Device):
+    # precheck asks for inspection of sensors reading 0 mV
+    interactive_init = True
+
     def __init__(self, stack: int, sensors: dict, sampling_time: int = 2, name: str = None):
         """
         Thermocouples DAQ (type J, K, T, N, E, B, R and S)
@@ -62,15 +75,17 @@ class TCHAT(Device):
         self.sensor_ids = sensor_ids
         self.sensors2read = {}
         self.header = []
+        config_cmds = []
 
         # configure sensors type
-        for k, v in sensors.items():
+        # iterate in channel order so the header matches the order of read_data
+        for k, v in sorted(sensors.items(), key=lambda kv: int(kv[0])):
             k = str(k)
             sensor_type = v.get('type', 'K')
             if sensor_type not in _sensor_types:
                 raise ValueError(f"Invalid sensor type {sensor_type}, must be one of {_sensor_types.keys()}")
             # set sensor type
-            subprocess.run(['smtc', self.address, 'stypewr', k, str(_sensor_types[sensor_type])], stdout=subprocess.PIPE)
+            config_cmds.append(['smtc', self.address, 'stypewr', k, str(_sensor_types[sensor_type])])
             if v.get('q', False):
                 if v['s_value'] is None or v['s_value'] <= 0:
                     raise ValueError(f"Sensor {k}: s_value must be greater than 0 for enabled sensors")
@@ -85,6 +100,17 @@ class TCHAT(Device):
                 'cmd': cmd,
                 'coeff': coeff
             }
+        subprocess.run(['sh', '-c', _batch_script(config_cmds)], stdout=subprocess.PIPE)
+
+        # per-channel command lines and coefficients, fixed after initialization
+        self._read_args = tuple(['smtc', self.address, self.sensors2read[str(ch)]['cmd'], str(ch)]
+                                for ch in self.sensor_ids)
+        self._coeffs = np.array([self.sensors2read[str(ch)]['coeff'] for ch in self.sensor_ids],
+                                dtype=np.float64)
+        # one value per line, in channel order
+        self._read_script = _batch_script(self._read_args)
+        self.freeze_keys()
+        self.init_out_pool(self.num_sensors)
         
         print('Run Precheck...')
         self.precheck()
@@ -94,9 +120,12 @@ class TCHAT(Device):
         # check the connection of the sensors
         # The initialization of devices is done in for loop
         # thue can be paused for manual inspection
-        for channel in self.sensor_ids:
-            q_mV = subprocess.run(['smtc', self.address, 'readmv', str(channel)], stdout=subprocess.PIPE)
-            q_mV = q_mV.stdout.decode('utf-8').rstrip('\n')
+        probe = _batch_script([['smtc', self.address, 'readmv', str(channel)] for channel in self.sensor_ids])
+        readings = subprocess.run(['sh', '-c', probe], stdout=subprocess.PIPE)
+        readings = readings.stdout.decode('utf-8').split()
+        if len(readings) != len(self.sensor_ids):
+            raise ValueError(f"TCHAT{self.address}: got {len(readings)} voltages for {len(self.sensor_ids)} sensors")
+        for channel, q_mV in zip(self.sensor_ids, readings):
             if float(q_mV) == 0:
                 # ask manual inspection: enter-to-continue. ctrl-c to stop
                 try: 
@@ -106,19 +135,27 @@ class TCHAT(Device):
                     exit(1)
             else:
                 print(f"Sensor {channel} is connected, voltage: {q_mV} mV")
-            time.sleep(0.5)
     
     def read_data(self):
-        # read the data 
-        output_data = []
-        for channel in self.sensor_ids:
-            channel = str(channel)
-            cmd = self.sensors2read[channel]['cmd']
-            coeff = self.sensors2read[channel]['coeff']
-            output = subprocess.run(['smtc', self.address, cmd, channel], stdout=subprocess.PIPE)
-            output = output.stdout.decode('utf-8').rstrip('\n')
-            output_data.append(float(output) * coeff)
-        time.sleep(self.sampling_time)
+        # read all channels in one call
+        output = subprocess.run(['sh', '-c', self._read_script], stdout=subprocess.PIPE)
+        return self._parse_output(output.stdout)
+
+    async def read_data_async(self):
+        proc = await asyncio.create_subprocess_exec('sh', '-c', self._read_script,
+                                                    stdout=asyncio.subprocess.PIPE)
+        stdout, _ = await proc.communicate()
+        return self._parse_output(stdout)
+
+    def _parse_output(self, stdout: bytes):
+        values = stdout.split()
+        if len(values) != self.num_sensors:
+            # a channel failed to report, errors go to stderr
+            return None
+        # the buffer comes from the pool, see Device.recycle
+        output_data = self._get_out_buffer()
+        output_data[:] = values
+        output_data *= self._coeffs
         return output_data
         
 
@@ -139,5 +176,6 @@ if __name__ == "__main__":
     stack = 0
     tchat = TCHAT(stack, sensors)
     while True:
-        data = TCHAT.read_data()
+        tchat.wait_for_next_sample()
+        data = tchat.read_data()
         print(data)
\ No newline at end of file
@@ -2,9 +2,13 @@ from devices.Base import *
 import serial
 import numpy as np
 from typing import List, Dict
+from concurrent.futures import Future
+import asyncio
 import threading
+import queue
 import time
 import json
+import re
 
 _error_codes = {
     0: "Invalid module",
@@ -18,6 +22,9 @@ _error_codes = {
     8: "Save executed properly",
 }
 
+# read response: <attr>=<value>@<address>\r
+_reply_re = re.compile(rb'([^\r\n=@]+)=([-+]?[0-9.]+(?:[eE][-+]?[0-9]+)?)@([0-9]+)\r')
+
 def extract_error_code(output_str: str) -> int:
     if output_str.startswith("CMD:"):
         # error code is single digit after '='
@@ -47,7 +54,6 @@ class TCM(Device):
         self.num_devices = num_devices
         self.ser = serial.Serial(self.serial_port, self.baudrate)
         self.write_mode = write
-        self.lock = threading.Lock()
 
         # check keys and values
         self.read_keys = read_keys or [] 
@@ -75,6 +81,8 @@ class TCM(Device):
                 self.header.append(k)
                 self.headermap[k] = len(self.header) - 1
         
+        self.freeze_keys()
+        
         # device number has to be specified in the read keys
         # split the read_keys into device number and attribute
         self.devices_lst = []
@@ -85,10 +93,18 @@ class TCM(Device):
                 raise ValueError("Invalid read key format")
             self.devices_lst.append(int(k_lst[1]))
             self.attrs_lst.append(k_lst[0])
+        # read commands are fixed, encode them once
+        self._read_cmds = [f"{attr}?@{addr}\r".encode() for addr, attr in zip(self.devices_lst, self.attrs_lst)]
+        # (attribute, address) expected in each reply, in header order
+        self._reply_keys = [(attr.encode(), str(addr).encode()) for addr, attr in zip(self.devices_lst, self.attrs_lst)]
 
         if write:
             self.write_attributes = [self.attrs_lst[self.headermap[k]] for k in self.write_keys]
             self.write_devices = [self.devices_lst[self.headermap[k]] for k in self.write_keys]
+            self._write_keys_idx = {k: i for i, k in enumerate(self.write_keys)}
+            # keys tuple -> (attributes, devices) of the write commands
+            self._write_keys_tuple = tuple(self.write_keys)
+            self._write_cmds_cache = {self._write_keys_tuple: (self.write_attributes, self.write_devices)}
 
         # check if the devices are valid
         if self.num_devices:
@@ -113,6 +129,15 @@ class TCM(Device):
         if self.sampling_time < self.read_time_buffer:
             raise ValueError(f"The sampling time must be greater than {self.read_time_buffer} seconds due to the number of keys to read")
         self.rest_time = self.sampling_time - self.read_time_buffer
+        # shortest possible reply to a full read batch, one '<attr>=<v>@<addr>\r' per key
+        self._min_response_len = sum(len(f"{attr}=0@{addr}\r") for addr, attr in zip(self.devices_lst, self.attrs_lst))
+        self.init_out_pool(self.header_size)
+
+        # after the precheck, the serial port is only touched by the worker thread;
+        # reads and writes are queued to it as requests
+        self._req_q = queue.SimpleQueue()
+        self._worker = threading.Thread(target=self._serial_worker, daemon=True)
+        self._worker.start()
      
         print("TCM at ", self.serial_port, " is successfully initialized \n")
 
@@ -131,13 +156,14 @@ class TCM(Device):
             bytes_waiting = self.ser.inWaiting()
             if bytes_waiting == 0:
                 raise ValueError(f"Device {addr} is possibly not connected")
-            output_str = (self.ser.readline(bytes_waiting)).decode()
-            if output_str.startswith("CMD:"):
-                error_code = extract_error_code(output_str)
+            raw = self.ser.read(bytes_waiting)
+            if raw.startswith(b"CMD:"):
+                error_code = extract_error_code(raw.decode())
                 raise AttributeError(f"Error code {error_code} for attribute {attr} to \
                                        address {addr}: {self._errorcode_report(error_code)}")
             else:
-                val = float(output_str.split('=')[1].replace(f'@{addr}', ''))
+                # reply is <attr>=<value>@<addr>\r
+                val = float(raw[raw.index(b'=') + 1:raw.rindex(b'@')])
                 print(f"Device {addr} is connected and attribute {attr} is valid, initial value: {val}")
                 data.append(val)
         return data
@@ -156,24 +182,93 @@ class TCM(Device):
                 print(f"Device {addr} is connected and write in {attr} with value {val} is valid")
                 # print(f"Write command {attr} to address {addr} with value {val} is successful")
     
-    def read_data(self):
+    def read_data(self, out: np.ndarray = None):
+        """
+        Read all header keys into a float64 array of size header_size.
+        - out: array to write into; by default a pooled buffer is returned, see Device.recycle
+        """
         # TODO: is flush neccesary?
         # TODO: check if collected data is correct/clean
         # send the read commands to the devices
-        init_time = time.time()
-        with self.lock:
-            for addr, attr in zip(self.devices_lst, self.attrs_lst):
-                self._read_cmd(attr, addr)
-            # read the data
-            output_str = (self.ser.readline(self.ser.inWaiting())).decode()   
-            if len(output_str.split('\r')[:-1]) != self.header_size:
-                return None
-            output_lst = [float(ele.split('=')[1][:-len(f'@{self.devices_lst[i]}')]) 
-                        for i, ele in enumerate(output_str.split('\r')[:-1])]
-        # assert len(output_lst) == self.header_size, "The number of output keys does not match the number of read keys"
-        time.sleep(max(0, self.sampling_time - (time.time() - init_time)))
-        return output_lst
+        init_time = time.monotonic()
+        # leave a margin of the sampling period for parsing
+        output_arr = self._submit(self._read_all, init_time + 0.9 * self.sampling_time, out)
+        # assert len(output_arr) == self.header_size, "The number of output keys does not match the number of read keys"
+        return output_arr
+
+    async def read_data_async(self, out: np.ndarray = None):
+        # the serial worker already runs the request, so just await its future
+        init_time = time.monotonic()
+        fut = self._enqueue(self._read_all, init_time + 0.9 * self.sampling_time, out)
+        return await asyncio.wrap_future(fut)
     
+    def _serial_worker(self):
+        """
+        Serve the queued serial requests one at a time.
+        """
+        while True:
+            func, args, fut = self._req_q.get()
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(func(*args))
+            except Exception as e:
+                fut.set_exception(e)
+
+    def _enqueue(self, func, *args) -> Future:
+        """
+        Queue func(*args) for the serial worker, returning its future.
+        """
+        fut = Future()
+        self._req_q.put((func, args, fut))
+        return fut
+
+    def _submit(self, func, *args):
+        """
+        Run func(*args) on the serial worker and wait for its result.
+        """
+        return self._enqueue(func, *args).result()
+
+    def _read_all(self, deadline: float, out: np.ndarray = None):
+        # drop late replies of a previous batch, they would shift this one
+        self.ser.reset_input_buffer()
+        for cmd in self._read_cmds:
+            self.ser.write(cmd)
+            time.sleep(self.cmd_gap)
+        # read the data; block until all replies are in rather than polling inWaiting
+        raw = self._read_responses(deadline)
+        replies = _reply_re.findall(raw)
+        if len(replies) != self.header_size:
+            return None
+        # every reply must answer the key of its column
+        for (attr, _, addr), key in zip(replies, self._reply_keys):
+            if (attr, addr) != key:
+                return None
+        if out is None:
+            out = self._get_out_buffer()
+        # numpy parses the matched bytes directly
+        out[:] = [value for _, value, _ in replies]
+        return out
+
+    def _read_responses(self, deadline: float) -> bytes:
+        """
+        Read the replies to a batch of read commands: block on the minimum expected
+        length first, then read_until each missing terminator or the deadline passes.
+        """
+        self.ser.timeout = max(0.001, deadline - time.monotonic())
+        raw = self.ser.read(self._min_response_len)
+        for _ in range(self.header_size - raw.count(b'\r')):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.ser.timeout = remaining
+            reply = self.ser.read_until(b'\r')
+            raw += reply
+            if not reply.endswith(b'\r'):
+                # timed out
+                break
+        return raw
+
     def _errorcode_report(self, code: int):
         return _error_codes.get(code, "Unknown error code")
     
@@ -194,34 +289,30 @@ class TCM(Device):
         """
         Write single command to the device
         """
-        with self.lock:
-            self._write_cmd(attr, address, val)
-            readout = self.ser.read(self.ser.inWaiting()).decode()
-            err_code = extract_error_code(readout)
-            if err_code != 1 or err_code != 8:
-                raise AttributeError(f"Error code {err_code} for attribute {attr} to \
-                                    address {address}: {self._errorcode_report(err_code)}")
+        self.write_cmds([attr], [address], [val])
     
     @Device.requires_write_mode
     def write_cmds(self, attributes: List[str], addresses: List[int], vals: List):
         """
         Write multiple commands to the devices
         """
-        with self.lock:
-            # alternative 1
-            for attr, addr, val in zip(attributes, addresses, vals):
-                self._write_cmd(attr, addr, val)
-            readout = self.ser.read(self.ser.inWaiting()).decode()
-            for line in readout.split('\r')[:-1]:
-                error_code = extract_error_code(line)
-                if error_code != 1 and error_code != 8:
-                    raise AttributeError(
-                        f"Error code {error_code} for attribute {attr} to"
-                        f"address {addr}: {self._errorcode_report(error_code)}")
-            # # alternative 2
-            # # not used due to the concern of inefficiency of ser.read
-            # for attr, addr, val in zip(attributes, addresses, vals):
-            #     self.write_cmd(attr, addr, val)
+        self._submit(self._write_all, attributes, addresses, vals)
+
+    def _write_all(self, attributes: List[str], addresses: List[int], vals: List):
+        # alternative 1
+        for attr, addr, val in zip(attributes, addresses, vals):
+            self._write_cmd(attr, addr, val)
+        readout = self.ser.read(self.ser.inWaiting()).decode()
+        for line in readout.split('\r')[:-1]:
+            error_code = extract_error_code(line)
+            if error_code != 1 and error_code != 8:
+                raise AttributeError(
+                    f"Error code {error_code} for attribute {attr} to "
+                    f"address {addr}: {self._errorcode_report(error_code)}")
+        # # alternative 2
+        # # not used due to the concern of inefficiency of ser.read
+        # for attr, addr, val in zip(attributes, addresses, vals):
+        #     self.write_cmd(attr, addr, val)
 
     @Device.requires_write_mode
     def write_data(self, data, keys=None, keys_validated=False):
@@ -234,35 +325,36 @@ class TCM(Device):
         """
         if isinstance(data, dict):
             # input data is a dictionary
-            keys = list(data.keys())
+            keys = tuple(data)
             vals = list(data.values())
-        elif isinstance(data, list) or isinstance(data, np.ndarray):
+        elif isinstance(data, (list, np.ndarray)):
             # input data is a list or numpy array
-            keys = keys or self.write_keys
             vals = data
-        elif isinstance(data, float) or isinstance(data, int):
+        elif isinstance(data, (float, int)):
             vals = [data]
-            keys = keys or self.write_keys
-            if not isinstance(keys, list):
-                keys = [keys]
         else:
             raise ValueError("The input data must be a dictionary, list, numpy array, or a single value")
+        # keys are looked up as tuples
+        if not keys:
+            keys = self._write_keys_tuple
+        elif isinstance(keys, str):
+            keys = (keys,)
+        elif not isinstance(keys, tuple):
+            keys = tuple(keys)
         assert len(keys) == len(vals), "The input data must match the keys"
 
-        if keys == self.write_keys:
-            self.write_cmds(self.write_attributes, self.write_devices, vals)
-        elif keys == self.tmp_write_keys:
-            self.write_cmds(self.tmp_write_attrs, self.tmp_write_devices, vals)
-        else:
+        cmds = self._write_cmds_cache.get(keys)
+        if cmds is None:
             # check if the keys are a subset of the write
             if not keys_validated and not self.issubset_write_keys(keys):
                 raise ValueError("The keys must be a subset of the write keys")
-            attrs = [self.write_attributes[self.write_keys.index(k)] for k in keys]
-            devices = [self.write_devices[self.write_keys.index(k)] for k in keys]
-            self.tmp_write_keys = keys
+            attrs = [self.write_attributes[self._write_keys_idx[k]] for k in keys]
+            devices = [self.write_devices[self._write_keys_idx[k]] for k in keys]
+            self.tmp_write_keys = list(keys)
             self.tmp_write_attrs = attrs
             self.tmp_write_devices = devices
-            self.write_cmds(attrs, devices, vals)
+            cmds = self._write_cmds_cache[keys] = (attrs, devices)
+        self.write_cmds(cmds[0], cmds[1], vals)
     
 if __name__ == "__main__":
     config = 'config_TCM_test.json'
@@ -277,6 +369,7 @@ if __name__ == "__main__":
     
     t = 0
     while t < 10:
+        tcm.wait_for_next_sample()
         data = tcm.read_data()
         print(data)
         if t == 3:
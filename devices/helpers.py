@@ -1,14 +1,18 @@
 from devices.Base import Device
 from devices.FluxDAQ import FluxDAQ
 from devices.SMTC import TCHAT
+from concurrent.futures import ThreadPoolExecutor
 import importlib
 
 
-def initialize_device(cls: str, config: dict) -> Device:
+# device classes by name; classes loaded from other modules are added on first use
+_CLASS_CACHE = {'FluxDAQ': FluxDAQ, 'TCHAT': TCHAT}
+
+
+def get_device_class(cls: str) -> type:
     # use cls name to choose the device class
-    if cls in globals():
-        device_class = globals()[cls]
-    else:
+    device_class = _CLASS_CACHE.get(cls)
+    if device_class is None:
         # Try to dynamically import the module
         try:
             # Assume the module is in the devices package with the same name as the class
@@ -17,30 +21,60 @@ def initialize_device(cls: str, config: dict) -> Device:
             device_class = getattr(module, cls)
         except (ImportError, AttributeError) as e:
             raise ValueError(f"Device class {cls} could not be loaded: {e}")
-    device = device_class(**config)
+        _CLASS_CACHE[cls] = device_class
+    return device_class
+
+def initialize_device(cls: str, config: dict) -> Device:
+    device = get_device_class(cls)(**config)
     return device
 
+def _is_interactive(cls: str) -> bool:
+    try:
+        return get_device_class(cls).interactive_init
+    except ValueError:
+        # the error is reported when the device is initialized
+        return False
+
 def initialize_devices(config_devices: dict):
-    devices = []
+    # flatten the config into (cls, cfg) pairs, in config order
+    device_configs = []
+    num_invalid = 0
     for cls, config in config_devices.items():
-        try:
-            if isinstance(config, list):
-                for cfg in config:
-                    device = initialize_device(cls, cfg)
-                    devices.append(device)
-            elif isinstance(config, dict):
-                device = initialize_device(cls, config)
-                devices.append(device)
-            else:
-                raise ValueError(f"Invalid config for device {cls}: {config}")
-        except Exception as e:
-            print(f"Error initializing {cls}: {e}")
-            continue
+        if isinstance(config, list):
+            device_configs.extend((cls, cfg) for cfg in config)
+        elif isinstance(config, dict):
+            device_configs.append((cls, config))
+        else:
+            print(f"Error initializing {cls}: Invalid config for device {cls}: {config}")
+            num_invalid += 1
+    num_configs = len(device_configs) + num_invalid
+
+    # the devices are initialized concurrently (their handshakes and prechecks mostly wait on I/O);
+    # devices that may ask for input during init run one at a time on the main thread instead,
+    # where Ctrl-C reaches them; the results keep the config order for the headers
+    results = {}
+    if device_configs:
+        with ThreadPoolExecutor(max_workers=len(device_configs)) as executor:
+            futures = [None if _is_interactive(cls) else executor.submit(initialize_device, cls, cfg)
+                       for cls, cfg in device_configs]
+            for i, ((cls, cfg), future) in enumerate(zip(device_configs, futures)):
+                if future is None:
+                    try:
+                        results[i] = initialize_device(cls, cfg)
+                    except Exception as e:
+                        print(f"Error initializing {cls}: {e}")
+            for i, ((cls, cfg), future) in enumerate(zip(device_configs, futures)):
+                if future is not None:
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        print(f"Error initializing {cls}: {e}")
+    devices = [results[i] for i in sorted(results)]
 
     if not devices:
         raise RuntimeError("No devices loaded. Exiting...")
-    elif len(devices) < len(config_devices):
-        print(f"Only {len(devices)} out of {len(config_devices)} devices loaded.")
+    elif len(devices) < num_configs:
+        print(f"Only {len(devices)} out of {num_configs} devices loaded.")
         try:
             input("Press Enter to continue, or terminated by Ctrl-C")
         except KeyboardInterrupt:
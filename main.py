@@ -1,10 +1,9 @@
 from devices.helpers import initialize_devices, get_devices_info
 from utils import read_config, hold_time
-from utils.data import DataCollector
+from utils.data import DataCollector, RingBuffer
 from utils.data import devices_read_threads
 from tqdm import tqdm
 import time
-import queue
 import traceback
 
 
@@ -27,8 +26,8 @@ def run():
     print(f"Device sampling times: {device_sampling_times}")
 
     # data queues and threads
-    queues = [queue.Queue() for _ in range(len(devices))]
-    threads = devices_read_threads(devices, queues)
+    queues = [RingBuffer(len(header)) for header in device_headers]
+    threads = tuple(devices_read_threads(devices, queues))
 
     # initilate data collector
     save = config.get('save', False)
@@ -36,6 +35,9 @@ def run():
     filename = config.get('filename', None)
     collector = DataCollector(queues, device_headers, save=save, filepath=filepath, filename=filename)
     writing_time = config['writing_time']
+    writing_time_ns = int(writing_time * 1e9)
+    # print the latest data at most every print_interval seconds
+    print_every = max(1, round(config.get('print_interval', 1) / writing_time))
 
     # holding time before starting the data collection
     holding_duration = config.get('holding_time', 0)
@@ -46,42 +48,49 @@ def run():
     if collection_duration <= 0:
         raise ValueError("Collection duration must be greater than 0 seconds.")
 
-    # start threads
-    timestamp = time.time()
+    # start threads; collection deadlines are on the monotonic clock
+    timestamp = time.monotonic_ns()
     print("\nStarting data collection threads...")
     for thread in threads:
         thread.start()
     
     # wait for threads to start
     time.sleep(max(device_sampling_times)*2)
-    start_time = time.time()
+    start_time = time.monotonic()
 
     # run data collection loop
     print("\nData collection started. Press Ctrl-C to stop.")
-    while time.time() - start_time < collection_duration:
-        # check if all threads are alive
-        if not all([thread.is_alive() for thread in threads]):
-            print("One or more threads are not alive. Exiting...")
-            for thread in threads:
-                thread.join(timeout=1)
-            break
-        # collect data
-        try:
-            collector.collect_data(timestamp+writing_time)
-            data_dict = collector.get_latest_dict_data()
-            print([f"{value:.2f}" for value in data_dict.values()])
-        except KeyboardInterrupt:
-            print("KeyboardInterrupt received. Exiting...")
-            for thread in threads:
-                thread.join(timeout=1)
-            break
-        except Exception as e:
-            traceback.print_exc()
-            for thread in threads:
-                thread.join(timeout=1)
-            break
-        # update timestamp
-        timestamp = timestamp + writing_time
+    tick = 0
+    try:
+        while time.monotonic() - start_time < collection_duration:
+            # check if all threads are alive
+            if not all(thread.is_alive() for thread in threads):
+                print("One or more threads are not alive. Exiting...")
+                for thread in threads:
+                    thread.join(timeout=1)
+                break
+            # collect data
+            try:
+                collector.collect_data(timestamp+writing_time_ns)
+                tick += 1
+                if tick % print_every == 0:
+                    data_dict = collector.get_latest_dict_data()
+                    print([f"{value:.2f}" for value in data_dict.values()])
+            except KeyboardInterrupt:
+                print("KeyboardInterrupt received. Exiting...")
+                for thread in threads:
+                    thread.join(timeout=1)
+                break
+            except Exception as e:
+                traceback.print_exc()
+                for thread in threads:
+                    thread.join(timeout=1)
+                break
+            # update timestamp
+            timestamp = timestamp + writing_time_ns
+    finally:
+        # write the buffered rows however the loop ends
+        collector.close_writer()
     print("Data collection stopped.")
 
 if __name__ == "__main__":
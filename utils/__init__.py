@@ -9,6 +9,10 @@ def read_config(config_file: str = 'config.json') -> Dict:
 
 def hold_time(seconds: int) -> None:
     print(f"Holding for {seconds} seconds...")
-    for i in tqdm(range(seconds), desc="Holding", unit="s"):
-        time.sleep(0.999)
+    # sleep against a monotonic deadline, updating the bar at most once per second
+    deadline = time.monotonic() + seconds
+    with tqdm(total=seconds, desc="Holding", unit="s") as bar:
+        while (remaining := deadline - time.monotonic()) > 0:
+            time.sleep(min(remaining, 1.0))
+            bar.update(1)
     
\ No newline at end of file
@@ -2,64 +2,122 @@
 from datetime import datetime
 import time
 from typing import Dict, List
-import queue
 import threading
+import queue
 import numpy as np
-import os, copy, csv
-
-
-def handle_empty_data():
-    pass
+import os
 
-def enqueue_data(queue: queue.Queue, data: List[float], 
-                 timestamp:float=None) -> None:
-    if timestamp: 
-        queue.put([timestamp] + data)
-    else:
-        queue.put([time.time()] + data)
 
-def dequeue_data(queue: queue.Queue, timestamp: float) -> List[float]:
+class RingBuffer:
     """
-    Dequeue all data from queue that's before the timestamp
-    and return the mean of the data
+    Preallocated ring of rows between one device thread (producer) and the collector (consumer).
+    The timestamps (int64 time.monotonic_ns()) and the data (float64) are kept in separate arrays.
+        - the producer adds rows with try_push (or reserve + publish)
+        - the consumer takes rows with drain_before
+    Only the producer moves tail and only the consumer moves head, so no lock is needed.
+    The capacity is rounded up to a power of two so that a row index is a mask.
     """
-    # take all data from queue that's before the timestamp
-    data = []
-    while not queue.empty():
-        if queue.queue[0][0] < timestamp:
-            data.append(queue.get()[1:])
+    def __init__(self, ncols: int, capacity: int = 1024) -> None:
+        capacity = 1 << max(0, capacity - 1).bit_length()
+        self.ncols = ncols
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.data = np.full((capacity, ncols), np.nan)
+        self._mask = capacity - 1
+        self.head = 0
+        self.tail = 0
+
+    def __len__(self) -> int:
+        return self.tail - self.head
+
+    def empty(self) -> bool:
+        return self.tail == self.head
+
+    def reserve(self) -> np.ndarray:
+        """
+        Return the data row of the next free slot, or None if the ring is full
+        """
+        if self.tail - self.head > self._mask:
+            return None
+        return self.data[self.tail & self._mask]
+
+    def publish(self, timestamp: int) -> None:
+        self.ts[self.tail & self._mask] = timestamp
+        self.tail += 1
+
+    def try_push(self, timestamp: int, data: List[float]) -> bool:
+        """
+        Add a row; returns False (and drops it) if the ring is full
+        """
+        slot = self.reserve()
+        if slot is None:
+            return False
+        slot[:] = data
+        self.publish(timestamp)
+        return True
+
+    def drain_before(self, timestamp: int, out: np.ndarray) -> int:
+        """
+        Move the data of the rows older than timestamp (ns) into out (capacity x ncols)
+        and return the number of rows moved
+        """
+        head, tail = self.head, self.tail
+        start = head & self._mask
+        stop = start + (tail - head)
+        # the published rows are buf[start:stop], split in two if they wrap around
+        if stop <= self.capacity:
+            segments = ((start, stop),)
         else:
-            break
-    if data:
-        # if data is not empty, return the mean of the data
-        return np.nanmean(data, axis=0)
-    else:
-        # if data is empty, return None
-        return None
-
-def read_device_data(device, queue: queue.Queue) -> None:
+            segments = ((start, self.capacity), (0, stop - self.capacity))
+        n = 0
+        for a, b in segments:
+            # timestamps are increasing, find the first row at or after timestamp
+            cut = a + int(np.searchsorted(self.ts[a:b], timestamp))
+            out[n:n + cut - a] = self.data[a:cut]
+            n += cut - a
+            if cut < b:
+                break
+        self.head = head + n
+        return n
+
+
+def handle_empty_data():
+    pass
+
+def read_device_data(device, queue: RingBuffer) -> None:
     """
     Continuously read data from device and put it in the queue
-    Note: the sampling time of device is executed by the read_data function itself
+    Note: the sampling time of device is kept by device.wait_for_next_sample
     """
     # check device base class
+    # the blocking parts (serial reads, subprocesses, sleeps) release the GIL;
+    # the bound methods are looked up once so the Python side of each step stays short
+    wait_for_next_sample = device.wait_for_next_sample
+    read_data = device.read_data
+    recycle = device.recycle
+    try_push = queue.try_push
+    monotonic_ns = time.monotonic_ns
     while True:
-        timestamp = time.time()
-        data = device.read_data()
+        wait_for_next_sample()
+        timestamp = monotonic_ns()
+        data = read_data()
         # print(device.name, timestamp, data) # NOTE: debug purpose
-        if data:
-            enqueue_data(queue, data, timestamp)
+        if data is not None and len(data) > 0:
+            # if the collector is not keeping up and the ring is full, the sample is dropped
+            try_push(timestamp, data)
+            # the values are copied into the queue, the buffer can be reused
+            recycle(data)
         else:
             handle_empty_data()
 
-def device_read_thread(device, queue: queue.Queue) -> threading.Thread:
+def device_read_thread(device, queue: RingBuffer) -> threading.Thread:
     thread = threading.Thread(target=read_device_data, 
                               args=(device, queue))
     thread.daemon = True
     return thread
 
 def devices_read_threads(devices: List, 
-                         queues: List[queue.Queue]) -> List[threading.Thread]:
+                         queues: List[RingBuffer]) -> List[threading.Thread]:
     assert len(devices) == len(queues), "Number of devices and queues should be the same"
     threads = []
     for device, q in zip(devices, queues):
@@ -67,44 +125,68 @@ def devices_read_threads(devices: List,
         threads.append(thread)
     return threads
 
-def wait_until_time(timestamp: float) -> None:
+def wait_until_time(deadline: int) -> None:
     """
-    Wait until the timestamp
+    Wait until the deadline, a time.monotonic_ns() value
     """
-    while time.time() < timestamp:
-        time.sleep(0.1)
+    remaining = deadline - time.monotonic_ns()
+    if remaining > 0:
+        time.sleep(remaining * 1e-9)
 
 class DataCollector:
     """
     Function of this class:
-        - save hashmap and list for data with headers
+        - save list for data with headers (a dict is built on request)
         - save last valid data
         - controller can directly access the latest step data
     The data collection frequency is same as the writing frequency.
-    (I don't see the need to write data asynchronously yet)
+    The csv rows are written by a separate writer thread, so disk latency does not delay collection.
     """
-    def __init__(self, queues: List[queue.Queue], headers: List[List[str]],
-                 save=False, filepath=None, filename=None) -> None:
+    def __init__(self, queues: List[RingBuffer], headers: List[List[str]],
+                 save=False, filepath=None, filename=None,
+                 flush_rows: int = 64, flush_interval: float = 5) -> None:
         assert len(queues) == len(headers), "Number of queues and headers should be the same"
-        if not queues[0].empty():
-            assert all([len(q) == len(h) for q, h in zip(queues, headers)]), "Number of data in each queue and header should be the same"
+        assert all([q.ncols == len(h) for q, h in zip(queues, headers)]), "Number of data in each queue and header should be the same"
 
         self.queues = queues
         self.headers = headers
         self.header_row = []
         for header in headers:
             self.header_row.extend(header)
-        self.array_start_idx = [0] + [len(header) for header in headers[:-1]]
+        # slot of each queue in the concatenated header / latest_array_data
+        lens = np.array([len(header) for header in headers])
+        starts = np.concatenate(([0], np.cumsum(lens)[:-1]))
+        self._slices = tuple(slice(int(s), int(s + l)) for s, l in zip(starts, lens))
         self.latest_queue_data = [None] * len(queues)
-        self.latest_array_data = [None] * len(self.header_row)
-        self.latest_dict_data = {head: None for head in self.header_row}
+        self.latest_array_data = np.full(len(self.header_row), np.nan)
+        # the dict view is built on demand from the frozen header order
+        self._header_tuple = tuple(self.header_row)
+        # all queues are drained into one scratch array, each into its own column block (its slot),
+        # so the means of all devices are computed at once; unused rows stay nan
+        self._fused = np.full((max(q.capacity for q in queues), len(self.header_row)), np.nan)
+        self._fused_nan = np.empty(self._fused.shape, dtype=bool)
+        self._fused_mean = np.empty(len(self.header_row), dtype=np.float64)
+        self._fused_valid = np.empty(len(self.header_row), dtype=np.int64)
+        # collection runs on time.monotonic_ns(); wall-clock time is only used for the csv rows
+        self._wall_offset = time.time_ns() - time.monotonic_ns()
 
         # print(self.headers)
         # print(self.header_row)
-        # print(self.array_start_idx)
+        # print(self._slices)
 
         self.save = save
-        self.writer = None
+        self.writingfile = None
+        self._write_q = queue.SimpleQueue()
+        self._writer_thread = None
+        self._writer_error = None
+        # rows are written in batches: every flush_rows rows or flush_interval seconds
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._row_buf = []
+        # the csv time has a resolution of one second, so the formatted string is reused within a second
+        self._last_sec = -1
+        self._last_sec_str = ""
+        self._last_flush = time.monotonic()
         if save:
             self.initiate_writer(filepath, filename)
     
@@ -127,67 +209,123 @@ class DataCollector:
             except OSError as e:
                 raise ValueError(f"Error deleting file {filename} from {os.path.abspath(filepath)}: {e}")
             
-        # csv writer
+        # csv file; rows are formatted with a format string built once from the header
         self.writingfile = open(os.path.join(filepath, filename), 'w', newline='')
-        self.writer = csv.writer(self.writingfile)
-        self.writer.writerow(['time'] + self.header_row)
+        self.writingfile.write(",".join(['time'] + self.header_row) + "\n")
+        self._row_fmt = "%s," + ",".join(["%.6g"] * len(self.header_row)) + "\n"
+        self._writer_thread = threading.Thread(target=self.write_rows, daemon=True)
+        self._writer_thread.start()
     
-    def save_data(self, data: List[float], timestamp: float) -> None:
-        if not self.writer:
+    def save_data(self, data: np.ndarray, timestamp: int) -> None:
+        # timestamp: wall-clock time in ns
+        # data is latest_array_data, its length matches the header by construction
+        if self._writer_thread is None:
             raise ValueError("Writer is not initialized")
-        if not data:
-            raise ValueError("Data is empty")
-        if len(data) != len(self.header_row):
-            raise ValueError(f"Data length {len(data)} does not match header length {len(self.header_row)}")
-        # write data to csv file
-        dt = datetime.fromtimestamp(timestamp)
-        row = [dt.strftime('%Y-%m-%d %H:%M:%S')] + data
-        self.writer.writerow(row)
+        if not self._writer_thread.is_alive():
+            raise RuntimeError(f"CSV writer stopped: {self._writer_error}") from self._writer_error
+        # hand a copy of the row to the writer thread
+        sec = timestamp // 1_000_000_000
+        if sec != self._last_sec:
+            self._last_sec = sec
+            self._last_sec_str = datetime.fromtimestamp(sec).strftime('%Y-%m-%d %H:%M:%S')
+        self._write_q.put((self._last_sec_str, data.copy()))
+
+    def write_rows(self) -> None:
+        """
+        Writer thread: format the queued rows and write them to the csv file
+        until the sentinel (None) from close_writer arrives.
+        An error stops the thread; it is raised by save_data and close_writer.
+        """
+        write_q = self._write_q
+        row_fmt = self._row_fmt
+        try:
+            while True:
+                rows = [write_q.get()]
+                while len(rows) < self.flush_rows:
+                    try:
+                        rows.append(write_q.get_nowait())
+                    except queue.Empty:
+                        break
+                # the sentinel is the last item ever put
+                stop = rows[-1] is None
+                if stop:
+                    rows.pop()
+                self._row_buf.extend(row_fmt % (dt_str, *data) for dt_str, data in rows)
+                if (stop or len(self._row_buf) >= self.flush_rows
+                        or time.monotonic() - self._last_flush >= self.flush_interval):
+                    self.flush_writer()
+                if stop:
+                    return
+        except Exception as e:
+            self._writer_error = e
+
+    def flush_writer(self) -> None:
+        # called from the writer thread only
+        self.writingfile.write("".join(self._row_buf))
         self.writingfile.flush()
+        self._row_buf.clear()
+        self._last_flush = time.monotonic()
 
     def close_writer(self) -> None:
-        if self.writer:
-            self.writer.close()
+        if self._writer_thread is not None:
+            # the writer thread writes the remaining rows before it exits
+            self._write_q.put(None)
+            self._writer_thread.join()
+            self._writer_thread = None
+            try:
+                self.writingfile.close()
+            finally:
+                self.writingfile = None
+            if self._writer_error is not None:
+                raise RuntimeError(f"CSV writer stopped, rows were lost: {self._writer_error}") from self._writer_error
     
     def update_queue_data(self, queue_idx: int, data: List[float]) -> None:
         self.latest_queue_data[queue_idx] = data
     
-    def update_array_data(self, queue_idx: int, data: List[float]) -> None:
-        start_idx = self.array_start_idx[queue_idx]
-        end_idx = start_idx + len(data)
-        self.latest_array_data[start_idx:end_idx] = data
+    def update_array_data(self, queue_idx: int, data: np.ndarray) -> None:
+        self.latest_array_data[self._slices[queue_idx]] = data
     
-    def update_dict_data(self, queue_idx: int, data: List[float]) -> None:
-        # for j, head in enumerate(self.headers[queue_idx]):
-        #     self.latest_dict_data[head] = data[j]
-        self.latest_dict_data.update(dict(zip(self.headers[queue_idx], data)))
-        
     def update_data(self, queue_idx: int, data: List[float]) -> None:
-        self.update_queue_data(queue_idx, data)
         self.update_array_data(queue_idx, data)
-        self.update_dict_data(queue_idx, data)
+        # data may be a reused buffer, keep the queue's slot of latest_array_data instead
+        self.update_queue_data(queue_idx, self.latest_array_data[self._slices[queue_idx]])
     
-    def get_latest_data(self) -> List[float]:
-        return copy.deepcopy(self.latest_array_data)
+    # values are floats, so shallow copies are enough
+    def get_latest_data(self) -> np.ndarray:
+        return self.latest_array_data.copy()
     
     def get_latest_dict_data(self) -> Dict[str, float]:
-        return copy.deepcopy(self.latest_dict_data)
+        return dict(zip(self._header_tuple, self.latest_array_data.tolist()))
     
-    def collect_data(self, timestamp: float) -> None:
+    def collect_data(self, timestamp: int) -> None:
         """
-        Collect data from all queues and update latest_queue_data, latest_array_data, latest_dict_data
+        Collect data from all queues and update latest_queue_data, latest_array_data
+        - timestamp: deadline of this collection step, a time.monotonic_ns() value
         """
         # wait the time pass the timestamp
         wait_until_time(timestamp)
         # collect data from all queues
-        for i, q in enumerate(self.queues):
-            data = dequeue_data(q, timestamp)
-            if data is None:
-                # if data is None, use last_valid_data[i]
-                data = self.latest_queue_data[i]
-                print('use last valid data for ', self.headers[i])
+        fused, slices = self._fused, self._slices
+        counts = [q.drain_before(timestamp, fused[:, s]) for q, s in zip(self.queues, slices)]
+        n = max(counts)
+        means = self._fused_mean
+        if n:
+            # nanmean over the rows of every column, in one pass for all devices
+            block = fused[:n]
+            isnan = np.isnan(block, out=self._fused_nan[:n])
+            valid = np.sum(isnan, axis=0, out=self._fused_valid)
+            np.subtract(n, valid, out=valid)
+            np.copyto(block, 0.0, where=isnan)
+            np.sum(block, axis=0, out=means)
+            with np.errstate(invalid='ignore'):
+                np.divide(means, valid, out=means)
+            block.fill(np.nan)
+        for i, count in enumerate(counts):
+            if count:
+                self.update_data(i, means[slices[i]])
             else:
-                self.update_data(i, data)
+                # if no data arrived, keep the last valid data
+                print('use last valid data for ', self.headers[i])
         
         if self.save:
-            self.save_data(self.latest_array_data, timestamp)
\ No newline at end of file
+            self.save_data(self.latest_array_data, timestamp + self._wall_offset)
\ No newline at end of file